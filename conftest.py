@@ -1,6 +1,7 @@
 import pytest
 
 from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.core.management import call_command
 
 from main.models import Repo
@@ -82,3 +83,14 @@ def use_dummy_cache_backend(settings):
             "BACKEND": "django.core.cache.backends.dummy.DummyCache",
         }
     }
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    settings.CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+    yield
+    cache.clear()
@@ -32,7 +32,8 @@
 
 from devel.utils import UserFinder
 from main.models import Arch, Package, PackageFile, Repo
-from packages.models import Depend, Conflict, FlagRequest, Provision, Replacement, Update, PackageRelation
+from packages.models import (Depend, Conflict, FlagRequest, Provision, Replacement, Update, PackageRelation,
+                             bump_package_caches)
 from packages.utils import parse_version
 
 
@@ -639,6 +640,9 @@ def read_repo(primary_arch, repo_file, options):
     logger.info('Finished database updates for %s.', repo_file)
     connection.commit()
     connection.close()
+    # files are not part of any cached package data
+    if not filesonly:
+        bump_package_caches()
     return 0
 
 # vim: set ts=4 sw=4 et:
@@ -61,6 +61,15 @@ def test_read_packages(self):
         import_packages = ["{}-{}-{}".format(pkg.pkgname, pkg.pkgver, pkg.pkgrel) for pkg in packages]
         self.assertCountEqual(files, import_packages)
 
+    def test_bump_package_caches(self):
+        with patch('devel.management.commands.reporead.bump_package_caches') as bump:
+            call_command('reporead', 'x86_64', 'devel/fixtures/core.db.tar.gz')
+            bump.assert_called_once_with()
+
+            bump.reset_mock()
+            call_command('reporead', '--filesonly', 'x86_64', 'devel/fixtures/core.db.tar.gz')
+            bump.assert_not_called()
+
     def test_flagoutofdate(self):
         pkg = self.create_pkg()
         FlagRequest.objects.create(pkgbase=pkg.pkgbase, repo=pkg.repo,
@@ -1,5 +1,23 @@
 from django.contrib import admin
+from django.db import transaction
+
 from main.models import Arch, Donor, Package, Repo
+from packages.models import bump_package_caches
+
+
+class PackageCacheAdmin(admin.ModelAdmin):
+    '''Drops the cached package data once an admin change is committed.'''
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(bump_package_caches)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        transaction.on_commit(bump_package_caches)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(bump_package_caches)
 
 
 class DonorAdmin(admin.ModelAdmin):
@@ -9,19 +27,19 @@ class DonorAdmin(admin.ModelAdmin):
     exclude = ('created',)
 
 
-class ArchAdmin(admin.ModelAdmin):
+class ArchAdmin(PackageCacheAdmin):
     list_display = ('name', 'agnostic', 'required_signoffs')
     list_filter = ('agnostic',)
     search_fields = ('name',)
 
 
-class RepoAdmin(admin.ModelAdmin):
+class RepoAdmin(PackageCacheAdmin):
     list_display = ('name', 'testing', 'staging', 'bugs_project', 'bugs_category', 'svn_root')
     list_filter = ('testing', 'staging')
     search_fields = ('name',)
 
 
-class PackageAdmin(admin.ModelAdmin):
+class PackageAdmin(PackageCacheAdmin):
     list_display = ('pkgname', 'full_version', 'repo', 'arch', 'packager', 'last_update', 'build_date')
     list_filter = ('repo', 'arch')
     search_fields = ('pkgname', 'pkgbase', 'pkgdesc')
@@ -0,0 +1,23 @@
+from main.utils import bump_cache_generation, cache_function
+
+
+def test_cache_function_generation(locmem_cache):
+    calls = []
+
+    @cache_function(None, generation='test')
+    def cached(value):
+        calls.append(value)
+        return value
+
+    assert cached(1) == 1
+    assert cached(1) == 1
+    assert calls == [1]
+
+    bump_cache_generation('test')
+    assert cached(1) == 1
+    assert calls == [1, 1]
+
+
+def test_bump_cache_generation_dummy():
+    # the dummy cache never stores the counter, bumping it must not fail
+    bump_cache_generation('test')
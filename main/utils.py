@@ -1,5 +1,6 @@
 import pickle
 import hashlib
+import time
 
 import markdown
 from markdown.extensions import Extension
@@ -19,7 +20,34 @@ def cache_function_key(func, args, kwargs):
     return 'cache_function.' + func.__name__ + '.' + key
 
 
-def cache_function(length):
+def cache_generation_key(generation):
+    return 'cache_generation.' + generation
+
+
+def get_cache_generation(generation):
+    '''Return the current value of the named generation counter. A missing
+    counter is seeded from the clock so it never lands back on a value that
+    may still have results cached under it.'''
+    key = cache_generation_key(generation)
+    value = cache.get(key)
+    if value is None:
+        value = int(time.time() * 1000)
+        if not cache.add(key, value, None):
+            value = cache.get(key, value)
+    return value
+
+
+def bump_cache_generation(generation):
+    '''Invalidate every cache_function result stored under the named
+    generation.'''
+    try:
+        cache.incr(cache_generation_key(generation))
+    except ValueError:
+        # the counter is not in the cache, so neither is anything keyed on it
+        pass
+
+
+def cache_function(length, generation=None):
     """
     A variant of the snippet posted by Jeff Wheeler at
     http://www.djangosnippets.org/snippets/109/
@@ -29,11 +57,15 @@ def cache_function(length):
     function, as it should.
 
     The decorator itself takes a length argument, which is the number of
-    seconds the cache will keep the result around.
+    seconds the cache will keep the result around, or None to keep it until
+    it is invalidated. If a generation name is given, its current counter is
+    part of the key, so bump_cache_generation() drops all such results at once.
     """
     def decorator(func):
         def inner_func(*args, **kwargs):
             key = cache_function_key(func, args, kwargs)
+            if generation is not None:
+                key = f'{key}.{get_cache_generation(generation)}'
             value = cache.get(key)
             if value is not None:
                 return value
@@ -111,7 +111,7 @@ def cleanup_signoff_comments():
     logger.info("getting all signoff groups")
     groups = get_signoff_groups()
 
-    id_signoffs = [signoff.id for g in groups for signoff in g.signoffs]
+    id_signoffs = [signoff_id for g in groups for signoff_id in g.signoffs]
     logger.info("Keeping %s signoffs", len(id_signoffs))
     # FakeSignoffSpecification's have no id
     id_signoffspecs = [g.specification.id for g in groups if not isinstance(g.specification, FakeSignoffSpecification)]
@@ -6,7 +6,7 @@
 from django.contrib.auth.models import User
 
 from main.models import Arch, Repo, Package
-from main.utils import set_created_field, database_vendor
+from main.utils import set_created_field, database_vendor, bump_cache_generation
 from packages.alpm import AlpmAPI
 
 
@@ -499,6 +499,19 @@ class Replacement(RelatedToBase):
     comparison = models.CharField(max_length=255, default='')
 
 
+# cache_function generation for results derived from packages and groups
+PACKAGES_CACHE_GENERATION = 'packages'
+
+
+def bump_package_caches():
+    '''Drop the cached results derived from packages and groups. Writers
+    call this explicitly (reporead once per run, the admin on package, arch
+    and repo edits) rather than hooking model signals: a delete listener
+    would stop Django from fast-deleting group rows, and files-only saves
+    need no invalidation.'''
+    bump_cache_generation(PACKAGES_CACHE_GENERATION)
+
+
 # hook up some signals
 for sender in (FlagRequest, PackageRelation,
                SignoffSpecification, Signoff, Update):
@@ -1,3 +1,25 @@
+from datetime import timedelta
+
+import pytest
+
+from main.models import Package, Repo
+from packages.models import PackageRelation, Signoff, SignoffSpecification
+from packages.utils import get_signoff_groups
+
+
+@pytest.fixture
+def testing_package(package, developer):
+    pkg = Package.objects.get(pkgname='linux')
+    pkg.pk = None
+    pkg.repo = Repo.objects.get(name='Testing')
+    pkg.pkgrel = str(int(pkg.pkgrel) + 1)
+    pkg.save()
+    PackageRelation.objects.create(pkgbase=pkg.pkgbase, user=developer,
+                                   type=PackageRelation.MAINTAINER)
+    yield pkg
+    pkg.delete()
+
+
 def test_signoffs(client, developer_client):
     response = client.get('/packages/signoffs/')
     assert response.status_code == 200
@@ -7,3 +29,106 @@ def test_signoffs_json(client, developer_client):
     response = client.get('/packages/signoffs/json/')
     assert response.status_code == 200
     assert response.json()['signoff_groups'] == []
+
+
+def test_get_signoff_groups(testing_package, developer):
+    groups = get_signoff_groups()
+    assert len(groups) == 1
+    group = groups[0]
+    assert group.pkgbase == testing_package.pkgbase
+    assert group.version == testing_package.full_version
+    assert group.target_repo == 'Core'
+    assert group.maintainers == [developer]
+
+
+def test_get_signoff_groups_user(testing_package, developer, admin_user):
+    assert len(get_signoff_groups(user=developer)) == 1
+    assert get_signoff_groups(user=admin_user) == []
+
+
+def test_get_signoff_groups_specification(testing_package):
+    group, = get_signoff_groups()
+    assert group.default_spec
+    assert group.required == testing_package.arch.required_signoffs
+
+    spec = SignoffSpecification.objects.create(
+        pkgbase=testing_package.pkgbase, pkgver=testing_package.pkgver,
+        pkgrel=testing_package.pkgrel, epoch=testing_package.epoch,
+        arch=testing_package.arch, repo=testing_package.repo, required=1)
+    group, = get_signoff_groups()
+    assert not group.default_spec
+    assert group.specification == spec
+    assert group.required == 1
+
+
+def test_get_signoff_groups_signoffs(testing_package, developer, admin_user):
+    group, = get_signoff_groups()
+    assert group.signoffs == {}
+    assert not group.approved
+    assert not group.user_signed_off(developer)
+
+    signoff, _ = Signoff.objects.get_or_create_from_package(testing_package, developer)
+    # a signoff for an older version of the package must not be picked up
+    Signoff.objects.create(pkgbase=testing_package.pkgbase, pkgver=testing_package.pkgver,
+                           pkgrel='1', epoch=testing_package.epoch, arch=testing_package.arch,
+                           repo=testing_package.repo, user=admin_user)
+    group, = get_signoff_groups()
+    assert group.signoffs == {signoff.id: signoff}
+    assert group.completed == 1
+    assert not group.approved
+    assert group.user_signed_off(developer)
+    assert not group.user_signed_off(admin_user)
+    assert not group.user_signed_off()
+
+    group.user = developer
+    assert group.user_signed_off()
+
+
+def test_get_signoff_groups_signoffs_order(testing_package, developer, admin_user):
+    signoff, _ = Signoff.objects.get_or_create_from_package(testing_package, developer)
+    earlier, _ = Signoff.objects.get_or_create_from_package(testing_package, admin_user)
+    earlier.created = signoff.created - timedelta(hours=1)
+    earlier.save()
+
+    group, = get_signoff_groups()
+    assert list(group.signoffs) == [earlier.id, signoff.id]
+
+
+def test_get_signoff_groups_split(testing_package):
+    for pkgname, pkgbase in (('linux-docs', 'linux'), ('glibc', 'glibc')):
+        pkg = Package.objects.get(pk=testing_package.pk)
+        pkg.pk = None
+        pkg.pkgname = pkgname
+        pkg.pkgbase = pkgbase
+        pkg.save()
+
+    groups = {g.pkgbase: g for g in get_signoff_groups()}
+    assert sorted(groups) == ['glibc', 'linux']
+    assert [p.pkgname for p in groups['linux'].packages] == ['linux', 'linux-docs']
+    assert [p.pkgname for p in groups['glibc'].packages] == ['glibc']
+    assert groups['linux'].version == testing_package.full_version
+
+    Package.objects.filter(pkgname='linux-docs').update(pkgrel='42')
+    groups = {g.pkgbase: g for g in get_signoff_groups()}
+    assert groups['linux'].version == ''
+
+
+def test_signoffs_json_group(client, developer_client, testing_package, developer):
+    Signoff.objects.get_or_create_from_package(testing_package, developer)
+    response = client.get('/packages/signoffs/json/')
+    assert response.status_code == 200
+    group, = response.json()['signoff_groups']
+    assert group['pkgbase'] == testing_package.pkgbase
+    assert [s['user'] for s in group['signoffs']] == [developer.username]
+
+    response = client.get('/packages/signoffs/')
+    assert response.status_code == 200
+    assert f'Signed off by {developer}' in response.content.decode()
+
+
+def test_get_signoff_groups_queries(testing_package, developer, django_assert_num_queries):
+    Signoff.objects.get_or_create_from_package(testing_package, developer)
+    with django_assert_num_queries(7):
+        group, = get_signoff_groups()
+        assert [s.user for s in group.signoffs.values()] == [developer]
+        assert group.maintainers == [developer]
@@ -0,0 +1,91 @@
+
+from django.utils.timezone import now
+
+from main.models import Arch, Package, Repo
+from packages.models import PackageGroup, PackageRelation, bump_package_caches
+from packages.utils import (get_group_info, get_target_repo_map,
+                            get_wrong_permissions, multilib_differences)
+
+
+def create_relation(pkgbase, user):
+    return PackageRelation.objects.create(pkgbase=pkgbase, user=user,
+                                          type=PackageRelation.MAINTAINER)
+
+
+def test_wrong_permissions(package, developer, admin_user):
+    allowed = create_relation('linux', developer)
+    no_profile = create_relation('glibc', admin_user)
+    missing = create_relation('doesnotexist', developer)
+    assert list(get_wrong_permissions()) == [no_profile]
+
+    pkg = Package.objects.get(pkgname='linux')
+    pkg.pk = None
+    pkg.repo = Repo.objects.get(name='Extra')
+    pkg.save()
+    assert set(get_wrong_permissions()) == {allowed, no_profile}
+    assert missing not in get_wrong_permissions()
+
+
+def test_group_info(package):
+    any_pkg = Package.objects.get(pkgname='pacman')
+    any_pkg.pk = None
+    any_pkg.pkgname = 'pacman-contrib'
+    any_pkg.arch = Arch.objects.get(name='any')
+    any_pkg.last_update = any_pkg.last_update.replace(year=any_pkg.last_update.year + 1)
+    any_pkg.save()
+    for pkgname in ('linux', 'glibc', 'pacman'):
+        PackageGroup.objects.create(name='base', pkg=Package.objects.get(pkgname=pkgname))
+    PackageGroup.objects.create(name='base', pkg=any_pkg)
+    PackageGroup.objects.create(name='contrib', pkg=any_pkg)
+
+    groups = get_group_info()
+    assert [(g['name'], g['arch'], g['count']) for g in groups] == [
+        ('base', 'x86_64', 4), ('contrib', 'x86_64', 1)]
+    assert all(g['last_update'] == any_pkg.last_update for g in groups)
+
+    assert get_group_info(['x86_64']) == groups
+    assert get_group_info(['i686']) == []
+
+
+def test_group_info_invalidation(locmem_cache, package):
+    assert get_group_info() == []
+
+    PackageGroup.objects.create(name='base', pkg=Package.objects.get(pkgname='linux'))
+    assert get_group_info() == []
+    bump_package_caches()
+    assert [g['name'] for g in get_group_info()] == ['base']
+
+    PackageGroup.objects.all().delete()
+    bump_package_caches()
+    assert get_group_info() == []
+
+
+def test_target_repo_map(package):
+    assert get_target_repo_map({'linux', 'missing'}) == {'linux': 'Core'}
+
+    for repo in ('Extra', 'Staging'):
+        pkg = Package.objects.get(pkgname='linux', repo__name='Core')
+        pkg.pk = None
+        pkg.repo = Repo.objects.get(name=repo)
+        pkg.save()
+    assert get_target_repo_map({'linux', 'missing'}) == {'linux': 'Core'}
+    assert get_target_repo_map(set()) == {}
+
+
+def test_multilib_differences_flagged(locmem_cache, package):
+    glibc = Package.objects.get(pkgname='glibc')
+    lib32 = Package.objects.get(pk=glibc.pk)
+    lib32.pk = None
+    lib32.pkgname = 'lib32-glibc'
+    lib32.pkgver = '0.1'
+    lib32.repo = Repo.objects.get(name='Multilib')
+    lib32.save()
+
+    (ml, reg), = multilib_differences()
+    assert (ml, reg) == (lib32, glibc)
+    assert reg.flag_date is None
+
+    # flagging goes through QuerySet.update(), which sends no signals
+    Package.objects.filter(pk=glibc.pk).update(flag_date=now())
+    (ml, reg), = multilib_differences()
+    assert reg.flag_date is not None
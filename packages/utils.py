@@ -1,19 +1,24 @@
 from collections import defaultdict
-from itertools import chain
-from operator import itemgetter
+from datetime import timezone
+from itertools import chain, groupby
+from operator import attrgetter, itemgetter
 import re
 
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import connection
-from django.db.models import Count, Max, F
+from django.db.models import Exists, Max, Min, F, OuterRef
 from django.db.models.query import QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import make_aware
 from django.contrib.auth.models import User
 
+from devel.models import UserProfile
 from main.models import Package, PackageFile, Arch, Repo
-from main.utils import database_vendor, groupby_preserve_order, PackageStandin
+from main.utils import cache_function, database_vendor, PackageStandin
 from .models import (PackageGroup, PackageRelation,
                      License, Depend, Conflict, Provision, Replacement,
-                     SignoffSpecification, Signoff, fake_signoff_spec)
+                     SignoffSpecification, Signoff, fake_signoff_spec,
+                     PACKAGES_CACHE_GENERATION)
 from todolists.models import TodolistPackage
 
 
@@ -33,44 +38,45 @@ def parse_version(version):
     return ver, rel, epoch
 
 
+@cache_function(300, generation=PACKAGES_CACHE_GENERATION)
 def get_group_info(include_arches=None):
-    raw_groups = PackageGroup.objects.values_list(
-        'name', 'pkg__arch__name').order_by('name').annotate(
-        cnt=Count('pkg'), last_update=Max('pkg__last_update'))
-    # now for post_processing. we need to separate things out and add
-    # the count in for 'any' to all of the other architectures.
-    group_mapping = {}
-    for grp in raw_groups:
-        arch_groups = group_mapping.setdefault(grp[1], {})
-        arch_groups[grp[0]] = {
-            'name': grp[0], 'arch': grp[1],
-            'count': grp[2], 'last_update': grp[3]
-        }
-
-    # we want to promote the count of 'any' packages in groups to the
-    # other architectures, and also add any 'any'-only groups
-    if 'any' in group_mapping:
-        any_groups = group_mapping['any']
-        del group_mapping['any']
-        for arch, arch_groups in group_mapping.items():
-            for grp in any_groups.values():
-                if grp['name'] in arch_groups:
-                    found = arch_groups[grp['name']]
-                    found['count'] += grp['count']
-                    if grp['last_update'] > found['last_update']:
-                        found['last_update'] = grp['last_update']
-                else:
-                    new_g = grp.copy()
-                    # override the arch to not be 'any'
-                    new_g['arch'] = arch
-                    arch_groups[grp['name']] = new_g
-
-    # now transform it back into a sorted list, including only the specified
-    # architectures if we got a list
-    groups = []
-    for key, val in group_mapping.items():
-        if not include_arches or key in include_arches:
-            groups.extend(iter(val.values()))
+    # the database does the post-processing for us: the count of 'any'
+    # packages in groups is promoted to each of the other architectures that
+    # have groups, which also adds any 'any'-only groups to them
+    sql = """
+SELECT g.name, a.name, COUNT(*), MAX(p.last_update)
+    FROM packages_packagegroup g
+    JOIN packages p ON g.pkg_id = p.id
+    JOIN arches pa ON p.arch_id = pa.id
+    JOIN arches a ON (a.id = p.arch_id OR pa.name = %s)
+    WHERE a.name != %s
+    AND a.id IN (
+        SELECT DISTINCT ap.arch_id
+        FROM packages_packagegroup ag
+        JOIN packages ap ON ag.pkg_id = ap.id
+    )
+    """
+    params = ['any', 'any']
+    # only include the specified architectures if we got a list
+    if include_arches:
+        sql += "AND a.name IN (" + ','.join(['%s' for _ in include_arches]) + ")"
+        params.extend(include_arches)
+    sql += """
+    GROUP BY g.name, a.name
+    """
+
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    groups = [{'name': name, 'arch': arch, 'count': count, 'last_update': last_update}
+              for name, arch, count, last_update in cursor]
+
+    # sqlite loves to return less than ideal types
+    if database_vendor(PackageGroup) == 'sqlite':
+        for group in groups:
+            last_update = parse_datetime(group['last_update'])
+            group['last_update'] = make_aware(last_update, timezone.utc)
+
+    # sort here rather than in SQL so the order does not depend on collation
     return sorted(groups, key=itemgetter('name', 'arch'))
 
 
@@ -89,39 +95,11 @@ def get_split_packages_info():
     return split_pkgs
 
 
-class Difference(object):
-    def __init__(self, pkgname, repo, pkg_a, pkg_b):
-        self.pkgname = pkgname
-        self.repo = repo
-        self.pkg_a = pkg_a
-        self.pkg_b = pkg_b
-
-    def classes(self):
-        '''A list of CSS classes that should be applied to this row in any
-        generated HTML. Useful for sorting, filtering, etc. Contains whether
-        this difference is in both architectures or the sole architecture it
-        belongs to, as well as the repo name.'''
-        css_classes = [self.repo.name.lower()]
-        if self.pkg_a and self.pkg_b:
-            css_classes.append('both')
-        elif self.pkg_a:
-            css_classes.append(self.pkg_a.arch.name)
-        elif self.pkg_b:
-            css_classes.append(self.pkg_b.arch.name)
-        return ' '.join(css_classes)
-
-    def __key(self):
-        return (self.pkgname, hash(self.repo),
-                hash(self.pkg_a), hash(self.pkg_b))
-
-    def __eq__(self, other):
-        return self.__key() == other.__key()
-
-    def __hash__(self):
-        return hash(self.__key())
-
-
-def multilib_differences():
+@cache_function(300, generation=PACKAGES_CACHE_GENERATION)
+def multilib_difference_ids():
+    '''Return (multilib, regular) package id pairs that differ in version.
+    Only the ids are cached; mutable fields such as flag_date change through
+    QuerySet.update(), which does not invalidate the cache.'''
     # Query for checking multilib out of date-ness
     if database_vendor(Package) == 'sqlite':
         pkgname_sql = """
@@ -164,37 +142,30 @@ def multilib_differences():
 
     cursor = connection.cursor()
     cursor.execute(sql, params)
-    results = cursor.fetchall()
+    return cursor.fetchall()
+
+
+def multilib_differences():
+    results = multilib_difference_ids()
 
     # fetch all of the necessary packages
     to_fetch = set(chain.from_iterable(results))
     pkgs = Package.objects.normal().in_bulk(to_fetch)
 
-    return [(pkgs[ml], pkgs[reg]) for ml, reg in results]
+    return [(pkgs[ml], pkgs[reg]) for ml, reg in results
+            if ml in pkgs and reg in pkgs]
 
 
 def get_wrong_permissions():
-    sql = """
-SELECT DISTINCT id
-    FROM (
-        SELECT pr.id, p.repo_id, pr.user_id
-        FROM packages p
-        JOIN packages_packagerelation pr ON p.pkgbase = pr.pkgbase
-        WHERE pr.type = %s
-    ) mp
-    LEFT JOIN (
-        SELECT user_id, repo_id FROM user_profiles_allowed_repos ar
-        INNER JOIN user_profiles up ON ar.userprofile_id = up.id
-    ) ur
-    ON mp.user_id = ur.user_id AND mp.repo_id = ur.repo_id
-    WHERE ur.user_id IS NULL;
-"""
-    cursor = connection.cursor()
-    cursor.execute(sql, [PackageRelation.MAINTAINER])
-    to_fetch = [row[0] for row in cursor.fetchall()]
+    '''Return all maintainer relations where the user is not allowed to
+    maintain packages in at least one of the repos the pkgbase lives in.'''
+    allowed_repos = UserProfile.allowed_repos.through.objects.filter(
+        userprofile__user_id=OuterRef(OuterRef('user_id'))).values('repo_id')
+    disallowed_pkgs = Package.objects.filter(
+        pkgbase=OuterRef('pkgbase')).exclude(repo_id__in=allowed_repos)
     relations = PackageRelation.objects.select_related(
         'user', 'user__userprofile').filter(
-            id__in=to_fetch)
+            Exists(disallowed_pkgs), type=PackageRelation.MAINTAINER)
     return relations
 
 
@@ -240,13 +211,19 @@ def approved_by_signoffs(signoffs, spec):
 
 class PackageSignoffGroup(object):
     '''Encompasses all packages in testing with the same pkgbase.'''
-    def __init__(self, packages):
+    __slots__ = ('packages', 'user', 'target_repo', 'signoffs', '_good_signoffs',
+                 '_signed_user_ids', 'default_spec', 'pkgbase', 'arch', 'repo', 'version', 'last_update',
+                 'packager', 'maintainers', 'specification', 'package')
+
+    def __init__(self, packages, maintainers=None):
         if len(packages) == 0:
             raise Exception
         self.packages = packages
         self.user = None
         self.target_repo = None
-        self.signoffs = set()
+        self.signoffs = {}
+        self._good_signoffs = []
+        self._signed_user_ids = frozenset()
         self.default_spec = True
 
         first = packages[0]
@@ -256,15 +233,18 @@ def __init__(self, packages):
         self.version = ''
         self.last_update = first.last_update
         self.packager = first.packager
-        self.maintainers = first.maintainers
+        if maintainers is None:
+            maintainers = first.maintainers
+        self.maintainers = maintainers
         self.specification = fake_signoff_spec(first.arch)
 
-        version = first.full_version
-        if all(version == pkg.full_version for pkg in packages):
-            self.version = version
+        versions = {pkg.full_version for pkg in packages}
+        if len(versions) == 1:
+            self.version = versions.pop()
 
-    @property
-    def package(self):
+        self.package = self.find_package()
+
+    def find_package(self):
         '''Try and return a relevant single package object representing this
         group. Start by seeing if there is only one package, then look for the
         matching package by name, finally falling back to a standin package
@@ -279,33 +259,37 @@ def package(self):
         return PackageStandin(self.packages[0])
 
     def find_signoffs(self, all_signoffs):
-        '''Look through a list of Signoff objects for ones matching this
-        particular group and store them on the object.'''
-        for s in all_signoffs:
-            if s.pkgbase != self.pkgbase:
-                continue
+        '''Look up the Signoff objects matching this particular group in a
+        dict keyed by (pkgbase, arch_id, repo_id) and store them on the
+        object, keyed by id.'''
+        key = (self.pkgbase, self.arch.id, self.repo.id)
+        for s in all_signoffs.get(key, ()):
             if self.version and not s.full_version == self.version:
                 continue
-            if s.arch_id == self.arch.id and s.repo_id == self.repo.id:
-                self.signoffs.add(s)
+            self.signoffs[s.id] = s
+        self._good_signoffs = [s for s in self.signoffs.values() if not s.revoked]
+        self._signed_user_ids = frozenset(s.user_id for s in self._good_signoffs)
 
     def find_specification(self, specifications):
-        for spec in specifications:
-            if spec.pkgbase != self.pkgbase:
-                continue
+        '''Look up the SignoffSpecification matching this group in a dict
+        keyed by (pkgbase, arch_id, repo_id) and store it on the object.'''
+        key = (self.pkgbase, self.arch.id, self.repo.id)
+        for spec in specifications.get(key, ()):
             if self.version and not spec.full_version == self.version:
                 continue
-            if spec.arch_id == self.arch.id and spec.repo_id == self.repo.id:
-                self.specification = spec
-                self.default_spec = False
-                return
+            self.specification = spec
+            self.default_spec = False
+            return
 
+    @property
     def approved(self):
-        return approved_by_signoffs(self.signoffs, self.specification)
+        if self.signoffs:
+            return len(self._good_signoffs) >= self.specification.required
+        return False
 
     @property
     def completed(self):
-        return sum(1 for s in self.signoffs if not s.revoked)
+        return len(self._good_signoffs)
 
     @property
     def required(self):
@@ -317,70 +301,42 @@ def user_signed_off(self, user=None):
         from a template.'''
         if user is None:
             user = self.user
-        return user in (s.user for s in self.signoffs if not s.revoked)
-
-    def __unicode__(self):
-        return f'{self.pkgbase}-{self.version} (self.arch): {len(self.signoffs)}'
+        return (user.id if user else None) in self._signed_user_ids
 
+    def __str__(self):
+        return f'{self.pkgbase}-{self.version} ({self.arch}): {len(self.signoffs)}'
 
-def signoffs_id_query(model, repos):
-    sql = """
-SELECT DISTINCT s.id
-    FROM %s s
-    JOIN packages p ON (
-        s.pkgbase = p.pkgbase
-        AND s.pkgver = p.pkgver
-        AND s.pkgrel = p.pkgrel
-        AND s.epoch = p.epoch
-        AND s.arch_id = p.arch_id
-        AND s.repo_id = p.repo_id
-    )
-    WHERE p.repo_id IN (%s)
-    AND s.repo_id IN (%s)
-    """
-    cursor = connection.cursor()
-    # query pre-process- fill in table name and placeholders for IN
-    repo_sql = ','.join(['%s' for _ in repos])
-    sql = sql % (model._meta.db_table, repo_sql, repo_sql)
-    repo_ids = [r.pk for r in repos]
-    # repo_ids are needed twice, so double the array
-    cursor.execute(sql, repo_ids * 2)
 
-    results = cursor.fetchall()
-    return [row[0] for row in results]
+def current_packages_exist():
+    '''An EXISTS clause for Signoff or SignoffSpecification querysets,
+    matching only rows for a package version that is currently in the repos.'''
+    return Exists(Package.objects.filter(
+        pkgbase=OuterRef('pkgbase'), pkgver=OuterRef('pkgver'),
+        pkgrel=OuterRef('pkgrel'), epoch=OuterRef('epoch'),
+        arch_id=OuterRef('arch_id'), repo_id=OuterRef('repo_id')))
 
 
 def get_current_signoffs(repos):
-    '''Returns a list of signoff objects for the given repos.'''
-    to_fetch = signoffs_id_query(Signoff, repos)
-    return Signoff.objects.select_related('user').in_bulk(to_fetch).values()
+    '''Returns a list of signoff objects for the given repos, oldest first.'''
+    return Signoff.objects.select_related('user').filter(
+        current_packages_exist(), repo__in=repos).order_by('created')
 
 
 def get_current_specifications(repos):
     '''Returns a list of signoff specification objects for the given repos.'''
-    to_fetch = signoffs_id_query(SignoffSpecification, repos)
-    return SignoffSpecification.objects.select_related('arch').in_bulk(to_fetch).values()
+    return SignoffSpecification.objects.select_related('arch').filter(
+        current_packages_exist(), repo__in=repos)
 
 
-def get_target_repo_map(repos):
-    sql = """
-SELECT DISTINCT p1.pkgbase, r.name
-    FROM packages p1
-    JOIN repos r ON p1.repo_id = r.id
-    JOIN packages p2 ON p1.pkgbase = p2.pkgbase
-    WHERE r.staging = %s
-    AND r.testing = %s
-    AND p2.repo_id IN (
-    """
-    sql += ','.join(['%s' for _ in repos])
-    sql += ")"
-
-    params = [False, False]
-    params.extend(r.pk for r in repos)
-
-    cursor = connection.cursor()
-    cursor.execute(sql, params)
-    return dict(cursor.fetchall())
+def get_target_repo_map(pkgbases):
+    '''Map each of the given pkgbases to the name of the non-testing,
+    non-staging repo it lives in. Should there be several, the first one by
+    name is picked.'''
+    target_repos = Package.objects.filter(
+        repo__staging=False, repo__testing=False,
+        pkgbase__in=pkgbases).values_list('pkgbase').annotate(
+            repo_name=Min('repo__name')).order_by()
+    return dict(target_repos)
 
 
 def get_signoff_groups(repos=None, user=None):
@@ -390,25 +346,39 @@ def get_signoff_groups(repos=None, user=None):
 
     test_pkgs = Package.objects.select_related(
         'arch', 'repo', 'packager').filter(repo__in=repo_ids)
-    packages = test_pkgs.order_by('pkgname')
-    packages = attach_maintainers(packages)
+    # order by the grouping key so each signoff group is a consecutive run
+    packages = test_pkgs.order_by('repo_id', 'arch_id', 'pkgbase', 'pkgname')
+    # Collect all pkgbase values in testing repos
+    pkgbases = set(test_pkgs.order_by().values_list('pkgbase', flat=True).distinct())
+
+    # Fetch the maintainers of every pkgbase in one go, rather than letting
+    # each signoff group look up its own
+    rels = PackageRelation.objects.select_related('user').filter(
+        type=PackageRelation.MAINTAINER,
+        pkgbase__in=pkgbases)
+    maintainers = defaultdict(list)
+    for rel in rels:
+        maintainers[rel.pkgbase].append(rel.user)
 
     # Filter by user if asked to do so
     if user is not None:
-        packages = [p for p in packages if user == p.packager or user in p.maintainers]
+        packages = [p for p in packages if user == p.packager or user in maintainers[p.pkgbase]]
 
-    # Collect all pkgbase values in testing repos
-    pkgtorepo = get_target_repo_map(repos)
+    pkgtorepo = get_target_repo_map(pkgbases)
 
     # Collect all possible signoffs and specifications for these packages
-    signoffs = get_current_signoffs(repos)
-    specs = get_current_specifications(repos)
-
-    same_pkgbase_key = lambda x: (x.repo.name, x.arch.name, x.pkgbase)
-    grouped = groupby_preserve_order(packages, same_pkgbase_key)
+    signoffs = defaultdict(list)
+    for signoff in get_current_signoffs(repos):
+        signoffs[(signoff.pkgbase, signoff.arch_id, signoff.repo_id)].append(signoff)
+    specs = defaultdict(list)
+    for spec in get_current_specifications(repos):
+        specs[(spec.pkgbase, spec.arch_id, spec.repo_id)].append(spec)
+
+    same_pkgbase_key = attrgetter('repo_id', 'arch_id', 'pkgbase')
     signoff_groups = []
-    for group in grouped:
-        signoff_group = PackageSignoffGroup(group)
+    for _, group in groupby(packages, same_pkgbase_key):
+        group = list(group)
+        signoff_group = PackageSignoffGroup(group, maintainers[group[0].pkgbase])
         signoff_group.target_repo = pkgtorepo.get(signoff_group.pkgbase, "Unknown")
         signoff_group.find_signoffs(signoffs)
         signoff_group.find_specification(specs)
@@ -184,9 +184,10 @@ def default(self, obj):
         if isinstance(obj, PackageSignoffGroup):
             data = {attr: getattr(obj, attr)
                     for attr in self.signoff_group_attrs}
+            data['signoffs'] = list(obj.signoffs.values())
             data['pkgnames'] = [p.pkgname for p in obj.packages]
             data['package_count'] = len(obj.packages)
-            data['approved'] = obj.approved()
+            data['approved'] = obj.approved
             data.update((attr, getattr(obj.specification, attr))
                         for attr in self.signoff_spec_attrs)
             return data
@@ -196,8 +197,6 @@ def default(self, obj):
             return str(obj)
         elif isinstance(obj, User):
             return obj.username
-        elif isinstance(obj, set):
-            return list(obj)
         return super(SignoffJSONEncoder, self).default(obj)
 
 
@@ -54,7 +54,7 @@ def package_links(self):
                 else:
                     yield PackageStandin(packages[0])
 
-    def __unicode__(self):
+    def __str__(self):
         return "RecentUpdate '%s %s' <%d packages>" % (
                 self.pkgbase, self.version, len(self.packages))
 